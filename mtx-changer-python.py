@@ -109,14 +109,14 @@
 # ---------------------------
 import os
 import re
+import math
 import sys
-import random
+import atexit
+import shlex
 import shutil
 import subprocess
-from time import sleep
+from time import sleep, monotonic, strftime
 from docopt import docopt
-from datetime import datetime
-from configparser import ConfigParser, BasicInterpolation
 
 # Set some variables
 # ------------------
@@ -133,11 +133,81 @@ prog_info_txt = progname + ' - v' + version + ' - ' + scriptname \
 # ------------------------------
 valid_mtx_cmd_lst = ['slots', 'list', 'listall', 'loaded', 'load', 'unload', 'transfer']
 
-# This list is so that we can reliably convert the True/False strings
+# The mtx_cmd choices which move a tape, and so need
+# the volume name(s) from the getvolname() function
+# --------------------------------------------------
+vol_mtx_cmd_set = frozenset(['load', 'unload', 'transfer'])
+
+# This set is so that we can reliably convert the True/False strings
 # from the config file into real booleans to be used in later tests.
-# -------------------------------------------------------------------
-cfg_file_true_false_lst = ['auto_clean', 'chk_drive', 'include_import_export', 'inventory',
-                           'log_cfg_vars', 'offline', 'strip_jobname', 'vxa_packetloader']
+# ------------------------------------------------------------------
+cfg_file_true_false_lst = frozenset(['auto_clean', 'chk_drive', 'include_import_export', 'inventory',
+                                     'log_cfg_vars', 'offline', 'strip_jobname', 'vxa_packetloader'])
+
+# This set is so that we can convert the numeric strings from the config
+# file into integers once, instead of calling int() each time they are used.
+# --------------------------------------------------------------------------
+cfg_file_int_lst = frozenset(['clean_poll_interval', 'clean_poll_timeout', 'clean_wait', 'debug_level',
+                              'load_sleep', 'load_wait', 'offline_sleep'])
+
+# The same for the numeric strings which may have a fraction of a second
+# ----------------------------------------------------------------------
+cfg_file_float_lst = frozenset(['load_poll_interval'])
+
+# Defaults for variables which may not be in older config
+# files. Any setting in the config file overrides these.
+# -------------------------------------------------------
+cfg_file_defaults_dict = {'load_poll_interval': '2', 'clean_poll_interval': '5', 'clean_poll_timeout': '0'}
+
+# Precompiled regex used to parse the 'mtx status' output. One
+# finditer() over the whole output returns every Data Transfer
+# Element, Storage Element, and IMPORT/EXPORT Storage Element
+# with its number, Empty/Full state, source slot, and volume.
+# ------------------------------------------------------------
+mtx_element_re = re.compile(r'^ *(?:Data Transfer Element (?P<drive>\d+)|Storage Element (?P<slot>\d+)(?P<ie> IMPORT.EXPORT)?)'
+                            r': *(?P<state>Empty|Full)(?: \((?:Unknown Storage Element|Storage Element (?P<src>\d+)) Loaded\))?'
+                            r'(?: *:VolumeTag *= *(?P<vol>[^\n]*\w))?', re.M)
+
+# Other precompiled regexes so that they are not
+# compiled again each time they are used.
+# ----------------------------------------------
+slots_re = re.compile(r'^ *Storage Changer [^\n]* Drives, (\d+) Slots', re.M)  # Number of slots in the mtx status output
+by_id_st_re = re.compile(r'^n*(st\d+).*$')                                      # The st# node a by-id/by-path link points to
+sa_node_re = re.compile(r'/dev/(sa\d+)')                                        # The sa# part of a FreeBSD tape drive node
+cln_action_re = re.compile(r'Cleaning action required')                         # sg_logs TapeAlert page cleaning message
+jobname_re = re.compile(r'(^.*)\.\d{4}\-\d{2}-\d{2}_.*')                        # A Job name with its datestamp
+cfg_section_re = re.compile(r'^\[([^\]]+)\]$')                                     # A [section] line in the config file
+cfg_option_re = re.compile(r'^([^=:\s][^=:]*?)\s*[=:]\s*(.*)$')                    # A 'key = value' line in the config file
+cfg_comment_re = re.compile(r'\s(?:# |;)')                                         # An inline comment at the end of a config file line
+
+# The 'mtx status' output is cached here the first time it
+# is needed so that list, listall, loaded, and slots do not
+# each call mtx. It is set back to None by anything that moves
+# a tape so the next caller gets the library's new status.
+# -------------------------------------------------------------
+mtx_status_txt = None
+
+# The 'mtx status' command running in the background, started
+# by start_mtx_status() and collected by mtx_status().
+# -----------------------------------------------------------
+mtx_status_proc = None
+
+# The library's slot count and elements parsed from
+# mtx_status_txt by mtx_elements(). Cleared along with it.
+# --------------------------------------------------------
+mtx_status_elements = None
+
+# The mtx_log_file is opened by the first log() call that
+# writes to it, and kept open until the script exits so
+# we do not open and close it for every line we log.
+# -------------------------------------------------------
+mtx_log_fh = None
+
+# The library name, JobId, and Job name that follow the time stamp
+# on each log line. None of them change while we run, so this is
+# built once, as soon as the command line has been parsed.
+# ----------------------------------------------------------------
+log_prefix = ''
 
 # Initialize these to satisfy the defaults
 # in the load() and unload() functions.
@@ -149,6 +219,11 @@ slot = drive_device = drv_idx = drive_index = ''
 linux_bin_lst = ['lsscsi_bin']
 fbsd_bin_lst = ['camcontrol_bin']
 
+# Binaries that are no longer called, but may still
+# be set in older config files, so they are not checked
+# -----------------------------------------------------
+unused_bin_lst = ['ls_bin', 'uname_bin']
+
 # Define the docopt string
 # ------------------------
 doc_opt_str = """
@@ -179,7 +254,7 @@ drive_index               The zero-based drive index.
 # ----------------------
 def now():
     'Return the current date/time in human readable format.'
-    return datetime.today().strftime('%Y-%m-%d %H:%M:%S')
+    return strftime('%Y-%m-%d %H:%M:%S')
 
 def usage():
     'Show the instructions and script information.'
@@ -189,14 +264,17 @@ def usage():
 
 def log(text, level, hdr=None):
     'Given some text and a debug level, write the text to the mtx_log_file.'
-    if level <= int(debug_level) and text != '':
-        with open(mtx_log_file, 'a+') as file:
-            file.write(('\n' if '[ Starting ' in text else '') \
-            + now() + ' ' \
-            + (chgr_name + ' ' if len(chgr_name) != 0 else '') \
-            + ('JobId: ' + jobid + ' ' if jobid not in ('', '0', 'None') else '') \
-            + ('Job: ' + jobname + ' ' if jobname not in ('', 'None', '*System*') else (jobname + ' ' if jobname != 'None' else '')) \
-            + ('- ' if hdr is None else '| ') + text.rstrip('\n') + '\n')
+    global mtx_log_fh
+    if level <= debug_level and text != '':
+        if mtx_log_fh is None:
+            # Line buffered, so every line is in the file even
+            # if the SD kills us while we wait on a drive
+            # -------------------------------------------------
+            mtx_log_fh = open(mtx_log_file, 'a+', buffering=1)
+            atexit.register(mtx_log_fh.close)
+        mtx_log_fh.write(('\n' if '[ Starting ' in text else '') \
+        + now() + ' ' + log_prefix \
+        + ('- ' if hdr is None else '| ') + text.rstrip('\n') + '\n')
 
 def print_opt_errors(opt, bin_var=None, tfk=None, tfv=None):
     'Print the incorrect variable and the reason it is incorrect.'
@@ -208,13 +286,66 @@ def print_opt_errors(opt, bin_var=None, tfk=None, tfv=None):
         error_txt = 'The binary variable \'' + bin_var[0] + '\', pointing to \'' + bin_var[1] + '\' does not exist or is not executable.'
     elif opt == 'truefalse':
         error_txt = 'The variable \'' + tfk + '\' (' + tfv + ') must be a boolean \'True\' or \'False\'.'
+    elif opt == 'int':
+        error_txt = 'The variable \'' + tfk + '\' (' + tfv + ') must be a whole number.'
+    elif opt == 'float':
+        error_txt = 'The variable \'' + tfk + '\' (' + tfv + ') must be a finite number.'
+    elif opt == 'positive':
+        error_txt = 'The variable \'' + tfk + '\' (' + tfv + ') must be greater than 0.'
+    elif opt == 'notnegative':
+        error_txt = 'The variable \'' + tfk + '\' (' + tfv + ') must be 0 or greater.'
     elif opt == 'mtx_cmd':
         error_txt = 'The mtx_cmd variable \'' + mtx_cmd  + '\' is invalid.\nValid mtx_cmd choices are: ' + ', '.join(valid_mtx_cmd_lst)
     return '\n' + error_txt
 
+def read_config(cfg_file, section):
+    'Return the section\'s variables from the config file, merged with the defaults.'
+    # The config file is a small, flat ini file so we read it
+    # ourselves here instead of importing configparser on every
+    # call. If we find anything our simple parse does not handle
+    # (continuation lines, %(var)s interpolation, duplicates, or
+    # a missing section) we let ConfigParser read the file so its
+    # values and error messages are exactly what they always were.
+    # -------------------------------------------------------------
+    sections = {}
+    options = None
+    with open(cfg_file) as fh:
+        for line in fh:
+            stripped = line.strip()
+            if stripped == '' or stripped[0] in '#;':
+                continue
+            if line[0].isspace() or '%' in stripped:
+                break
+            comment = cfg_comment_re.search(stripped)
+            if comment:
+                stripped = stripped[:comment.start()].rstrip()
+            sec = cfg_section_re.match(stripped)
+            opt = cfg_option_re.match(stripped)
+            if sec and sec.group(1) not in sections:
+                options = sections[sec.group(1)] = {}
+            elif opt and options is not None and opt.group(1).lower() not in options:
+                options[opt.group(1).lower()] = opt.group(2)
+            else:
+                break
+        else:
+            if section in sections or section == 'DEFAULT':
+                cfg_dict = dict(cfg_file_defaults_dict)
+                cfg_dict.update(sections.get('DEFAULT', {}))
+                cfg_dict.update(sections.get(section, {}))
+                return cfg_dict
+    from configparser import ConfigParser, BasicInterpolation
+    config = ConfigParser(defaults=cfg_file_defaults_dict, inline_comment_prefixes=('# ', ';'), interpolation=BasicInterpolation())
+    config.read(cfg_file)
+    return dict(config.items(section))
+
 def log_cmd_results(result):
     'Given a subprocess.run() result object, clean up the extra line feeds from stdout and stderr and log them.'
     log('In function log_cmd_results()', 50)
+    # Nothing below is logged unless the debug_level is at least 40,
+    # so do not bother stripping and joining the command's output
+    # ---------------------------------------------------------------
+    if debug_level < 40:
+        return
     stdout = result.stdout.rstrip('\n')
     stderr = result.stderr.rstrip('\n')
     if stdout == '':
@@ -229,27 +360,31 @@ def chk_cmd_result(result, cmd):
     'Given a result object, check the returncode, then log and exit if non zero.'
     log('In function: chk_cmd_result()', 50)
     if result.returncode != 0:
-        log('ERROR calling: ' + cmd, 20)
+        log('ERROR calling: ' + shlex.join(cmd), 20)
         # The SD will print this stdout after 'Result=' in the job log
         # ------------------------------------------------------------
         print(result.stderr.rstrip('\n'))
         sys.exit(result.returncode)
 
 def get_shell_result(cmd):
-    'Given a command to run, return the subprocess.run() result.'
+    'Given a command list to run, return the subprocess.run() result.'
     log('In function: get_shell_result()', 50)
-    return subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    # The command is run directly, without a /bin/sh in between. If the
+    # binary cannot be run at all, return what a shell would have.
+    # -------------------------------------------------------------------
+    try:
+        return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    except OSError as err:
+        return subprocess.CompletedProcess(cmd, 127, '', str(err))
 
 def get_uname():
     'Get the OS uname to be use in other tests.'
     log('In function: get_uname()', 50)
-    cmd = uname_bin
+    # os.uname() makes the same system call the 'uname'
+    # command does, so there is no need to run it.
+    # --------------------------------------------------
     log('Getting OS\'s uname so we can use it for other tests.', 40)
-    log('shell command: ' + cmd, 30)
-    result = get_shell_result(cmd)
-    log_cmd_results(result)
-    chk_cmd_result(result, cmd)
-    return result.stdout.rstrip('\n')
+    return os.uname().sysname
 
 def cmd_exists(cmd):
     'Check that a binary command exists and is executable.'
@@ -265,28 +400,19 @@ def cmd_exists(cmd):
 def chk_bins():
     'Check that all defined binaries exist and are executable.'
     log('In function: chk_bins()', 50)
+    # Here we make sure to only test binary commands that exist
+    # on the platform by building the set of the other platforms'
+    # binaries once, and skipping anything in it. The binaries
+    # we no longer call are always skipped
+    # -----------------------------------------------------------
+    skip_bin_set = set(linux_bin_lst + fbsd_bin_lst + unused_bin_lst)
+    if uname == 'Linux':
+        skip_bin_set.difference_update(linux_bin_lst)
+    elif uname == 'FreeBSD':
+        skip_bin_set.difference_update(fbsd_bin_lst)
     for bin_var in config_dict.items():
-        if '_bin' in bin_var[0]:
-            # Here we make sure to only test binary
-            # commands that exist on the platform
-            # -------------------------------------
-            if (bin_var[0] in linux_bin_lst and uname == 'Linux') \
-                or (bin_var[0] in fbsd_bin_lst and uname == 'FreeBSD'):
-                if cmd_exists(bin_var):
-                    pass
-                else:
-                    print(print_opt_errors('bin', bin_var))
-                    usage()
-            elif bin_var[0] not in linux_bin_lst and bin_var[0] not in fbsd_bin_lst:
-                if cmd_exists(bin_var):
-                    pass
-                else:
-                    print(print_opt_errors('bin', bin_var))
-                    usage()
-            elif (bin_var[0] in linux_bin_lst and uname != 'Linux') \
-                  or (bin_var[0] in fbsd_bin_lst and uname != 'FreeBSD'):
-                pass
-            else:
+        if '_bin' in bin_var[0] and bin_var[0] not in skip_bin_set:
+            if not cmd_exists(bin_var):
                 print(print_opt_errors('bin', bin_var))
                 usage()
 
@@ -294,20 +420,18 @@ def get_ready_str():
     'Determine the OS so we can set the correct mt "ready" string.'
     log('In function: get_ready_str()', 50)
     if uname == 'Linux':
+        # The 'mt' from mt-st and the one from GNU cpio print different
+        # "ready" strings, so check which one is installed.
+        # --------------------------------------------------------------
+        cmd = [mt_bin, '--version']
+        log('mt command: ' + shlex.join(cmd), 30)
+        result = get_shell_result(cmd)
+        log_cmd_results(result)
         if os.path.isfile('/etc/debian_version'):
-            cmd = mt_bin + ' --version | grep "mt-st"'
-            log('mt command: ' + cmd, 30)
-            result = get_shell_result(cmd)
-            log_cmd_results(result)
-            if result.returncode == 1:
-                return 'drive status'
-        else:
-            cmd = mt_bin + ' --version | grep "GNU cpio"'
-            log('mt command: ' + cmd, 30)
-            result = get_shell_result(cmd)
-            log_cmd_results(result)
-            if result.returncode == 0:
+            if 'mt-st' not in result.stdout:
                 return 'drive status'
+        elif 'GNU cpio' in result.stdout:
+            return 'drive status'
         return 'ONLINE'
     elif uname == 'SunOS':
         return 'No Additional Sense'
@@ -323,15 +447,7 @@ def slots():
     'Print the number of slots in the library.'
     log('In function: slots()', 50)
     log('Determining the number of slots in the library.', 20)
-    cmd = mtx_bin + ' -f ' + chgr_device + ' status'
-    log('mtx command: ' + cmd, 30)
-    result = get_shell_result(cmd)
-    log_cmd_results(result)
-    chk_cmd_result(result, cmd)
-    # Storage Changer /dev/tape/by-id/scsi-SSTK_L80_XYZZY_B:4 Drives, 44 Slots ( 4 Import/Export )
-    # --------------------------------------------------------------------------------------------
-    slots_line = re.search('Storage Changer.*', result.stdout)
-    slots = re.sub(r'^Storage Changer.* Drives, (\d+) Slots.*', '\\1', slots_line.group(0))
+    slots = mtx_elements()['slots']
     log('Library' + (' ' + chgr_name if len(chgr_name) != 0 else '') + ' (' + chgr_device + ')' + ' has ' + slots + ' slots', 20)
     log('slots output: ' + slots, 40)
     return slots
@@ -339,33 +455,107 @@ def slots():
 def call_inventory():
     'Call mtx with the inventory command if the inventory variable is True.'
     log('In function: call_inventory()', 50)
-    cmd = mtx_bin + ' -f ' + chgr_device + ' inventory'
-    log('mtx command: ' + cmd, 30)
+    cmd = mtx_prefix_lst + ['inventory']
+    log('mtx command: ' + shlex.join(cmd), 30)
     result = get_shell_result(cmd)
     log_cmd_results(result)
     chk_cmd_result(result, cmd)
     return
 
+def start_mtx_status():
+    'Start the "mtx status" command in the background, unless it is already running or its output is cached.'
+    global mtx_status_proc
+    log('In function: start_mtx_status()', 50)
+    if mtx_status_txt is None and mtx_status_proc is None:
+        cmd = mtx_prefix_lst + ['status']
+        log('mtx command: ' + shlex.join(cmd), 30)
+        mtx_status_proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+def mtx_status():
+    'Return the library\'s "mtx status" output, only calling mtx if it has not already been cached.'
+    global mtx_status_txt, mtx_status_proc
+    log('In function: mtx_status()', 50)
+    if mtx_status_txt is None:
+        start_mtx_status()
+        stdout, stderr = mtx_status_proc.communicate()
+        result = subprocess.CompletedProcess(mtx_status_proc.args, mtx_status_proc.returncode, stdout, stderr)
+        mtx_status_proc = None
+        log_cmd_results(result)
+        chk_cmd_result(result, result.args)
+        mtx_status_txt = result.stdout
+    else:
+        log('Using cached mtx status output', 40)
+    return mtx_status_txt
+
+def clear_mtx_status():
+    'Clear the cached "mtx status" output after a tape has been moved.'
+    global mtx_status_txt, mtx_status_elements
+    log('In function: clear_mtx_status()', 50)
+    mtx_status_txt = None
+    mtx_status_elements = None
+
+def mtx_elements():
+    'Parse the mtx status output once, returning a dictionary of the library\'s slot count and elements.'
+    global mtx_status_elements
+    log('In function: mtx_elements()', 50)
+    # The startup listall() call parses the status, so
+    # loaded(), list(), and slots() can use what it found.
+    # ----------------------------------------------------
+    if mtx_status_elements is not None:
+        return mtx_status_elements
+    # The 'drive', 'storage', and 'importexport' keys are dictionaries of
+    # the elements keyed by their number, in the order mtx listed them.
+    # Each element is the groupdict() of its mtx_element_re match, with
+    # an empty string for anything not on the line (ie: no VolumeTag).
+    # -------------------------------------------------------------------
+    # Storage Changer /dev/tape/by-id/scsi-SSTK_L80_XYZZY_B:4 Drives, 44 Slots ( 4 Import/Export )
+    # --------------------------------------------------------------------------------------------
+    status = mtx_status()
+    slots_line = slots_re.search(status)
+    mtx_status_elements = {'slots': slots_line.group(1) if slots_line else '0',
+                           'drive': {}, 'storage': {}, 'importexport': {}}
+    for match in mtx_element_re.finditer(status):
+        element = match.groupdict('')
+        if element['drive'] != '':
+            mtx_status_elements['drive'][element['drive']] = element
+        elif element['ie'] == '':
+            mtx_status_elements['storage'][element['slot']] = element
+        else:
+            mtx_status_elements['importexport'][element['slot']] = element
+    return mtx_status_elements
+
+def element_vol(element):
+    'Given an element, return its volume, NO_BARCODE if it is full without a VolumeTag, or \'\' if it is empty.'
+    if element is None or element['state'] == 'Empty':
+        return ''
+    return element['vol'] if element['vol'] != '' else 'NO_BARCODE'
+
+def element_txt(element):
+    'Given an element from mtx_elements(), return it in the listall format required by the SD.'
+    if element['drive'] != '':
+        return 'D:' + element['drive'] + (':E' if element['state'] == 'Empty' else ':F:' + element['src'] + ':' + element_vol(element))
+    return ('S:' if element['ie'] == '' else 'I:') + element['slot'] \
+           + (':E' if element['state'] == 'Empty' else ':F:' + element_vol(element))
+
+def slot_element(slt):
+    'Given a slot, return its storage (or import/export if include_import_export is True) element from the startup status.'
+    element = all_elements['storage'].get(slt)
+    if element is None and include_import_export:
+        element = all_elements['importexport'].get(slt)
+    return element
+
 def loaded():
     'If the drive is loaded, return the slot that is in it, otherwise return 0'
     log('In function: loaded()', 50)
     log('Checking if drive device ' + drive_device + ' (drive index: ' + drive_index + ') is loaded', 20)
-    cmd = mtx_bin + ' -f ' + chgr_device + ' status'
-    log('mtx command: ' + cmd, 30)
-    result = get_shell_result(cmd)
-    log_cmd_results(result)
-    chk_cmd_result(result, cmd)
-    # We re.search() for drive_index:Full lines and then we return 0
+    # We look for the drive_index's Full element and then we return 0
     # if the drive is empty, or the number of the slot that is loaded
     # For the debug log, we also print the volume name and the slot.
-    # TODO: Maybe skip the re.search() and just get what I need with
-    # the re.subs
     # ---------------------------------------------------------------
-    drive_loaded_line = re.search('Data Transfer Element ' + drive_index + ':Full.*', result.stdout)
-    if drive_loaded_line is not None:
-        slot_and_vol_loaded = (re.sub(r'^Data Transfer Element.*Element (\d+) Loaded.*= (\w+)', '\\1 \\2', drive_loaded_line.group(0))).split()
-        slot_loaded = slot_and_vol_loaded[0]
-        vol_loaded = slot_and_vol_loaded[1]
+    element = mtx_elements()['drive'].get(drive_index)
+    if element is not None and element['state'] == 'Full':
+        slot_loaded = element['src']
+        vol_loaded = element['vol']
         log('Drive device ' + drive_device + ' (drive index: ' \
             + drive_index + ') is loaded with volume (' + vol_loaded \
             + ') from slot ' + slot_loaded, 20)
@@ -379,89 +569,56 @@ def loaded():
 def list():
     'Return the list of slots and volumes in the slot:volume format required by the SD.'
     log('In function: list()', 50)
-    # Does this library require an inventory command before the list command?
-    # -----------------------------------------------------------------------
-    if inventory:
-        call_inventory()
-    cmd = mtx_bin + ' -f ' + chgr_device + ' status'
-    log('mtx command: ' + cmd, 30)
-    result = get_shell_result(cmd)
-    log_cmd_results(result)
-    chk_cmd_result(result, cmd)
+    # If this library requires an inventory command, it was
+    # already called at startup, before mtx_elements() was
+    # -----------------------------------------------------
+    elements = mtx_elements()
     # Create lists of only full Data Transfer Elements, Storage Elements, and possibly
     # the Import/Export elements. Then concatenate them into one 'mtx_elements_list' list.
     # ------------------------------------------------------------------------------------
-    mtx_elements_txt = ''
-    data_transfer_elements_list = re.findall(r'Data Transfer Element \d+:Full.*\w', result.stdout)
-    storage_elements_list = re.findall(r'Storage Element \d+:Full.*', result.stdout)
+    data_transfer_elements_list = [element for element in elements['drive'].values() if element['state'] == 'Full']
+    storage_elements_list = [element for element in elements['storage'].values() if element['state'] == 'Full']
+    importexport_elements_list = []
     if include_import_export:
-        importexport_elements_list = re.findall(r'Storage Element \d+ IMPORT.EXPORT:Full.*\w', result.stdout)
+        importexport_elements_list = [element for element in elements['importexport'].values() if element['state'] == 'Full']
     # waa - 20231008 - If the data transfer elements are listed first, a bconsole
     #                  `status slots` output always shows slot 1 as empty, so they
     #                  are added last to match what `mtx-changer` outputs.
-    # mtx_elements_list = data_transfer_elements_list + storage_elements_list \
-    #                   + (importexport_elements_list if 'importexport_elements_list' in locals() else [])
+    # mtx_elements_list = data_transfer_elements_list + storage_elements_list + importexport_elements_list
     # ----------------------------------------------------------------------------------------------------
-    mtx_elements_list = storage_elements_list \
-                      + (importexport_elements_list if 'importexport_elements_list' in locals() else []) \
-                      + data_transfer_elements_list
+    mtx_elements_list = storage_elements_list + importexport_elements_list + data_transfer_elements_list
 
-    # Parse the results of the status output and
-    # format it the way the SD expects to see it.
-    # -------------------------------------------
+    # Format the elements the way the SD expects to see them. Drives
+    # are listed with the slot their volume was loaded from. Elements
+    # without a barcode are listed in the listall NO_BARCODE format.
+    # ---------------------------------------------------------------
+    # waa - 20230518 - Original grep/sed used in mtx-changer bash/perl script for VXA libraries:
+    # grep " *Storage Element [1-9]*:.*Full" | sed "s/ *Storage Element //" | sed "s/Full :VolumeTag=//"
+    # The mtx_element_re regex allows for this, so VXA PacketLoaders need no special handling here.
+    # ---------------------------------------------------------------------------------------------------
+    mtx_elements_txt_lst = []
     for element in mtx_elements_list:
-        tmp_txt = re.sub(r'Data Transfer Element \d+:Full \(Storage Element (\d+) Loaded\):VolumeTag = (\w)', '\\1:\\2', element)
-        # waa - 20230518 - I need to find out what the actual packetloader text is so I can verify/test this.
-        # Original grep/sed used in mtx-changer bash/perl script for VXA libraries:
-        # grep " *Storage Element [1-9]*:.*Full" | sed "s/ *Storage Element //" | sed "s/Full :VolumeTag=//"
-        # ---------------------------------------------------------------------------------------------------
-        if vxa_packetloader:
-            tmp_txt = re.sub(' *Storage Element [0-9]*:.*Full', '', tmp_txt)
-            tmp_txt = re.sub('Full :VolumeTag=', '', tmp_txt)
+        if element['vol'] == '':
+            mtx_elements_txt_lst.append(element_txt(element))
         else:
-            if include_import_export:
-                tmp_txt = re.sub(r'Storage Element (\d+) IMPORT.EXPORT:Full :VolumeTag=(.*)', '\\1:\\2', tmp_txt)
-            tmp_txt = re.sub(r'Storage Element (\d+):Full :VolumeTag=(\w)', '\\1:\\2', tmp_txt)
-            tmp_txt = re.sub(r'Storage Element (\d+):Full', 'S:\\1:F:NO_BARCODE', tmp_txt)
-            mtx_elements_txt += tmp_txt + ('' if element == mtx_elements_list[-1] else '\n')
+            mtx_elements_txt_lst.append((element['src'] if element['drive'] != '' else element['slot']) + ':' + element['vol'])
+    mtx_elements_txt = '\n'.join(mtx_elements_txt_lst)
     log('list output:\n' + mtx_elements_txt, 40)
     return mtx_elements_txt
 
 def listall():
     'Return the list of slots and volumes in the format required by the SD.'
     log('In function: listall()', 50)
-    # Does this library require an inventory command before the status command?
-    # -------------------------------------------------------------------------
-    if inventory:
-        call_inventory()
-    cmd = mtx_bin + ' -f ' + chgr_device + ' status'
-    log('mtx command: ' + cmd, 30)
-    result = get_shell_result(cmd)
-    log_cmd_results(result)
-    chk_cmd_result(result, cmd)
-    # Create lists of all Data Transfer Elements, Storage Elements, and possibly Import/Export
-    # elements - empty, or full. Then concatenate them into one 'mtx_elements_list' list.
-    # ----------------------------------------------------------------------------------------
-    mtx_elements_txt = ''
-    data_transfer_elements_list = re.findall(r'Data Transfer Element \d+:.*\w', result.stdout)
-    storage_elements_list = re.findall(r'Storage Element \d+:.*\w', result.stdout)
-    if include_import_export:
-        importexport_elements_list = re.findall(r'Storage Element \d+ IMPORT.EXPORT.*\w', result.stdout)
-    mtx_elements_list = data_transfer_elements_list + storage_elements_list \
-                      + (importexport_elements_list if 'importexport_elements_list' in locals() else [])
-    # Parse the results of the status output and
-    # format it the way the SD expects to see it.
-    # -------------------------------------------
-    for element in mtx_elements_list:
-        tmp_txt = re.sub(r'Data Transfer Element (\d+):Empty', 'D:\\1:E', element)
-        tmp_txt = re.sub(r'Data Transfer Element (\d+):Full \(Storage Element (\d+) Loaded\):VolumeTag = (.*)', 'D:\\1:F:\\2:\\3', tmp_txt)
-        tmp_txt = re.sub(r'Storage Element (\d+):Empty(:VolumeTag){0,1}', 'S:\\1:E', tmp_txt)
-        tmp_txt = re.sub(r'Storage Element (\d+):Full :VolumeTag=(.*)', 'S:\\1:F:\\2', tmp_txt)
-        tmp_txt = re.sub(r'Storage Element (\d+):Full.*', 'S:\\1:F:NO_BARCODE', tmp_txt)
-        if include_import_export:
-            tmp_txt = re.sub(r'Storage Element (\d+) IMPORT.EXPORT:Empty(:VolumeTag){0,1}', 'I:\\1:E', tmp_txt)
-            tmp_txt = re.sub(r'Storage Element (\d+) IMPORT.EXPORT:Full :VolumeTag=(.*)', 'I:\\1:F:\\2', tmp_txt)
-        mtx_elements_txt += tmp_txt + ('' if element == mtx_elements_list[-1] else '\n')
+    # If this library requires an inventory command, it was
+    # already called at startup, before mtx_elements() was
+    # -----------------------------------------------------
+    elements = mtx_elements()
+    # Format all Data Transfer Elements, Storage Elements, and possibly Import/Export
+    # elements - empty, or full - the way the SD expects to see them, one per line.
+    # -------------------------------------------------------------------------------
+    mtx_elements_list = [*elements['drive'].values(), *elements['storage'].values(),
+                         *(elements['importexport'].values() if include_import_export else [])]
+    mtx_elements_txt = '\n'.join([element_txt(element) for element in mtx_elements_list])
     log('listall output:\n' + mtx_elements_txt, 40)
     return mtx_elements_txt
 
@@ -471,74 +628,62 @@ def getvolname(cln_slot=None):
     # ------------------------------------------------------------
     log('In function: getvolname()', 50)
     if mtx_cmd == 'transfer':
-        vol = re.search('[SI]:' + slot + ':.:(.*)', all_slots)
-        if vol:
-            src_vol = vol.group(1)
-        else:
-            src_vol = ''
+        src_vol = element_vol(slot_element(slot))
         # Remember, for the transfer command, the SD sends the destination
         # slot in the drive_device position in the command line options.
         # ----------------------------------------------------------------
-        vol = re.search('[SI]:' + drive_device + ':.:(.*)', all_slots)
-        if vol:
-            dst_vol = vol.group(1)
-        else:
-            dst_vol = ''
+        dst_vol = element_vol(slot_element(drive_device))
         return src_vol, dst_vol
     elif mtx_cmd == 'load':
-        vol = re.search('[SI]:' + slot + ':.:(.*)', all_slots)
-        if vol:
-            return vol.group(1), ''
+        vol = element_vol(slot_element(slot))
+        if vol != '':
+            return vol, ''
         else:
             # Slot we are loading might be in a drive
             # TODO: In load(), let's fail due to this!
             # ----------------------------------------
-            vol = re.search('D:' + drive_index + ':F:\\d+:(.*)', all_slots)
-            if vol:
-                return vol.group(1), ''
-            else:
-                return '', ''
+            return element_vol(all_elements['drive'].get(drive_index)), ''
     elif mtx_cmd == 'unload':
-        vol = re.search('D:' + drive_index + ':F:\\d+:(.*)', all_slots)
-        if vol:
-            src_vol = vol.group(1)
-        else:
-            src_vol = ''
-        vol = re.search('[SI]:' + slot + ':.:(.*)', all_slots)
-        if vol:
-            dst_vol = vol.group(1)
-        else:
-            dst_vol = ''
+        src_vol = element_vol(all_elements['drive'].get(drive_index))
+        dst_vol = element_vol(slot_element(slot))
         return src_vol, dst_vol
 
 def wait_for_drive(vol):
     'Wait a maximum of load_wait seconds for the drive to become ready.'
     log('In function: wait_for_drive()', 50)
-    s = 0
-    log('Waiting a maximum of ' + load_wait + ' \'load_wait\' seconds for drive to become ready', 20)
-    while s <= int(load_wait):
-        cmd = mt_bin + ' -f ' + drive_device + ' status'
-        log('mt command: ' + cmd, 30)
+    log('Waiting a maximum of ' + str(load_wait) + ' \'load_wait\' seconds for drive to become ready', 20)
+    deadline = monotonic() + load_wait
+    timed_out = False
+    # Most drives are ready within a second or two of the mtx load command
+    # returning, so we start checking after 0.1 seconds and double the time
+    # between checks each time, up to a maximum of load_poll_interval seconds.
+    # -------------------------------------------------------------------------
+    interval = 0.1
+    while True:
+        cmd = [mt_bin, '-f', drive_device, 'status']
+        log('mt command: ' + shlex.join(cmd), 30)
         result = get_shell_result(cmd)
         log_cmd_results(result)
         chk_cmd_result(result, cmd)
-        if re.search(ready, result.stdout):
+        if ready in result.stdout:
             log('Device ' + drive_device + ' (drive index: ' + drive_index + ') ready', 20)
             break
-        log('Device ' + drive_device + ' (drive index: ' + drive_index + ') not ready, sleeping for one second and retrying...', 20)
-        sleep(1)
-        s += 1
-    if s == int(load_wait) + 1:
-        log('The maximum \'load_wait\' time of ' + load_wait + ' seconds has been reached', 20)
+        if monotonic() >= deadline:
+            timed_out = True
+            break
+        log('Device ' + drive_device + ' (drive index: ' + drive_index + ') not ready, waiting a maximum of ' \
+            + str(interval) + ' seconds and retrying...', 20)
+        sleep(min(interval, max(deadline - monotonic(), 0)))
+        interval = min(interval * 2, load_poll_interval)
+    if timed_out:
+        log('The maximum \'load_wait\' time of ' + str(load_wait) + ' seconds has been reached', 20)
         log('Timeout waiting for drive device ' + drive_device + ' (drive index: ' + drive_index + ')'
             + ' to signal that it is loaded', 20)
         log('Perhaps the Device\'s "DriveIndex" is incorrect', 20)
-        log('Exiting with return code 1', 30)
         return 1
     else:
         log('Successfully loaded volume' + (' (' + vol[0] + ')' if volume != '' else '') + ' from slot ' + slot \
             + ' to drive device ' + drive_device + ' (drive index: ' + drive_index + ')', 20)
-        log('Exiting with return code 0', 30)
         return 0
 
 def chk_for_cln_tapes():
@@ -548,75 +693,92 @@ def chk_for_cln_tapes():
     # idea where in the cleaning process it is, so we
     # need to ignore cleaning tapes in drives.
     # ------------------------------------------------
-    cln_tapes = re.findall(r'S:(\d+):F:(' + cln_str + '.*)', all_slots)
+    cln_elements = [all_elements['storage']]
     if include_import_export:
-        cln_tapes += re.findall(r'I:(\d+):F:(' + cln_str + '.*)', all_slots)
+        cln_elements.append(all_elements['importexport'])
+    cln_tapes = [(element['slot'], element['vol']) for elements in cln_elements for element in elements.values()
+                 if element['state'] == 'Full' and element['vol'].startswith(cln_str)]
     if len(cln_tapes) > 0:
         log('Found the following cleaning tapes: ' + str(cln_tapes), 20)
     else:
         log('No cleaning tapes found in library', 20)
     return cln_tapes
 
-def clean(cln_tapes):
+def clean(cln_tapes, sg=None):
     'Given the cln_tapes list of available cleaning tapes, randomly pick one and load it.'
     log('In function: clean()', 50)
     log('Selecting a cleaning tape', 20)
-    # cln_tuple = random.choice(cln_tapes)
+    # The random module is only needed here, so it is only
+    # imported when a drive is actually going to be cleaned
+    # ------------------------------------------------------
+    import random
     cln_tuple = random.choice(cln_tapes)
     cln_slot = cln_tuple[0]
     cln_vol = cln_tuple[1]
     log('Will load cleaning tape (' + cln_vol + ') from slot ' + cln_slot \
         + ' into drive device ' + drive_device + ' (drive index: ' + drive_index + ')', 20)
-    load(cln_slot, drive_device, drive_index, (cln_vol, ''), cln=True)
+    load(cln_slot, drive_device, drive_index, (cln_vol, ''), cln=True, sg=sg)
 
 def get_sg_node():
     'Given a drive_device, return the /dev/sg# node.'
     log('In function: get_sg_node()', 50)
     log('Determining the tape drive\'s scsi generic device node required by sg_logs', 20)
     if uname == 'Linux':
-        # Use `lsscsi` on Linux to always identify the
-        # correct scsi generic device node on-the-fly.
-        # --------------------------------------------
+        # Use sysfs (or `lsscsi` if that fails) on Linux to always
+        # identify the correct scsi generic device node on-the-fly.
+        # ---------------------------------------------------------
         # On Linux, tape drive device nodes may be specified
         # as '/dev/nst#' or '/dev/tape/by-id/scsi-3XXXXXXXX-nst' (the
         # preferred method), or even with '/dev/tape/by-path/*', so we
-        # will determine which one it is and then use the output from
-        # `lsscsi` to match it to its corresponding /dev/sg# node.
+        # will determine which one it is and then look up the st node
+        # in /sys/class/scsi_tape to find its /dev/sg# node.
         # ------------------------------------------------------------
         # drive_device = '/dev/nst0'
         # drive_device = '/dev/tape/by-id/scsi-350223344ab000900-nst'
         # drive_device = '/dev/tape/by-path/STK-T10000B-XYZZY_B1-nst'
         # -----------------------------------------------------------
-        # TODO: waa - 20240302 - These lines before the if statement
-        # are not necessary. Probably are here for logging mainly
-        # -----------------------------------------------------------
-        cmd = ls_bin + ' -l ' + drive_device
-        log('ls command: ' + cmd, 30)
-        result = get_shell_result(cmd)
-        log_cmd_results(result)
-        chk_cmd_result(result, cmd)
         if '/dev/st' in drive_device or '/dev/nst' in drive_device:
             # OK, we caught the simple /dev/st# or /dev/nst# case
             # ---------------------------------------------------
-            st = drive_device
+            link = drive_device
         elif '/by-id' in drive_device or '/by-path' in drive_device:
             # OK, we caught the /dev/tape/by-id or /dev/tape/by-path case
             # -----------------------------------------------------------
-            # The ls command outputs a line feed that needs to be stripped
-            # ------------------------------------------------------------
-            st = '/dev/' + re.sub(r'.* -> .*/n*(st\d+).*$', '\\1', result.stdout.rstrip('\n'), re.S)
-        cmd = lsscsi_bin + ' -g'
-        log('lsscsi command: ' + cmd, 30)
+            # os.readlink() gives us the link's target (ie: '../../nst0')
+            # directly, so we do not need to call `ls -l` and parse it
+            # -----------------------------------------------------------
+            try:
+                link = os.readlink(drive_device)
+            except OSError as err:
+                log('Failed to read the link for drive device ' + drive_device + ': ' + str(err), 20)
+                return 1
+            log('Drive device ' + drive_device + ' links to: ' + link, 40)
+        # Both sysfs and lsscsi only know the rewinding st# name,
+        # never the non-rewinding nst# one, so always look up st#
+        # --------------------------------------------------------
+        st = '/dev/' + by_id_st_re.sub('\\1', os.path.basename(link))
+        # The kernel lists the st node's scsi generic device (ie: 'sg4')
+        # in this directory, so we do not need to call `lsscsi` for it
+        # ---------------------------------------------------------------
+        sg_dir = '/sys/class/scsi_tape/' + os.path.basename(st) + '/device/scsi_generic'
+        try:
+            sg = '/dev/' + os.listdir(sg_dir)[0]
+            log('SG node for drive device: ' + drive_device + ' (drive index: ' + drive_index + ') --> ' + sg, 20)
+            return sg
+        except (OSError, IndexError) as err:
+            log('Could not read ' + sg_dir + ' (' + str(err) + '), will try lsscsi', 40)
+        cmd = [lsscsi_bin, '-g']
+        log('lsscsi command: ' + shlex.join(cmd), 30)
         result = get_shell_result(cmd)
         log_cmd_results(result)
         chk_cmd_result(result, cmd)
-        sg_search = re.search('.*' + st + ' .*(/dev/sg\\d+)', result.stdout)
+        sg_search = re.search(st + ' .*(/dev/sg\\d+)', result.stdout)
         if sg_search:
             sg = sg_search.group(1)
             log('SG node for drive device: ' + drive_device + ' (drive index: ' + drive_index + ') --> ' + sg, 20)
             return sg
     elif uname == 'FreeBSD':
-        sa = re.sub(r'/dev/(sa\d+)', '\\1', drive_device)
+        sa = sa_node_re.sub('\\1', drive_device)
         # On FreeBSD, tape drive device nodes are '/dev/sa#'
         # and their corresponding scsi generic device nodes
         # are '/dev/pass#'. We can correlate them with the
@@ -631,8 +793,8 @@ def get_sg_node():
         # <STK T10000B 0107>    at scbus5 target 0 lun 0 (pass4,sa1)
         # <STK T10000B 0107>    at scbus6 target 0 lun 0 (pass6,sa3)
         # -----------------------------------------------------------
-        cmd = camcontrol_bin + ' devlist'
-        log('camcontrol command: ' + cmd, 30)
+        cmd = [camcontrol_bin, 'devlist']
+        log('camcontrol command: ' + shlex.join(cmd), 30)
         result = get_shell_result(cmd)
         log_cmd_results(result)
         chk_cmd_result(result, cmd)
@@ -641,9 +803,10 @@ def get_sg_node():
             sg = '/dev/' + sg_search.group(1)
             log('SG node for drive device: ' + drive_device + ' (drive index: ' + drive_index + ') --> ' + sg, 20)
             return sg
-    else:
-        log('Failed to identify an sg node device for drive device ' + drive_device, 20)
-        return 1
+    # Nothing matched, or this is not Linux or FreeBSD
+    # ------------------------------------------------
+    log('Failed to identify an sg node device for drive device ' + drive_device, 20)
+    return 1
 
 def tapealerts(sg):
     'Call the sglogs_bin and return any tape alerts.'
@@ -658,9 +821,9 @@ def tapealerts(sg):
     # -------------------------------------------------------------------------------
     # Call sg_logs and parse for 'Cleaning action required'
     # -----------------------------------------------------
-    cmd = sglogs_bin + ' --page=0xc ' + sg
+    cmd = [sglogs_bin, '--page=0xc', sg]
     log('Checking' + ' drive (sg node: ' + sg + ') with sg_logs utility', 20)
-    log('sg_logs command: ' + cmd, 30)
+    log('sg_logs command: ' + shlex.join(cmd), 30)
     result = get_shell_result(cmd)
     log_cmd_results(result)
     chk_cmd_result(result, cmd)
@@ -671,7 +834,43 @@ def tapealerts(sg):
     # sg_logs --page=0xc /dev/sg5 | grep "Cleaning action"
     # Cleaning action not required (or completed)
     # ----------------------------------------------------
-    return re.search(r'Cleaning action required', result.stdout)
+    return cln_action_re.search(result.stdout)
+
+def wait_for_clean(sg):
+    'Check the drive every clean_poll_interval seconds, for a maximum of clean_poll_timeout seconds, until it is clean.'
+    log('In function: wait_for_clean()', 50)
+    deadline = monotonic() + clean_poll_timeout
+    cmd = [sglogs_bin, '--page=0xc', sg]
+    while True:
+        # The cleaning tape is still in the drive, so we do not call
+        # tapealerts() here. Its chk_cmd_result() would exit on an
+        # sg_logs error and leave the cleaning tape loaded. Instead
+        # we stop checking and let load() unload the cleaning tape.
+        # -------------------------------------------------------------
+        log('sg_logs command: ' + shlex.join(cmd), 30)
+        result = get_shell_result(cmd)
+        log_cmd_results(result)
+        if result.returncode != 0:
+            log('ERROR calling: ' + shlex.join(cmd) + ', will stop checking drive device ' + drive_device
+                + ' (' + sg + ') for \'Cleaning action required\'', 20)
+            return 1
+        if not cln_action_re.search(result.stdout):
+            log('Drive device ' + drive_device + ' (' + sg + ') no longer reports \'Cleaning action required\'', 20)
+            return 0
+        if clean_poll_timeout == 0:
+            # The default is to check only once, right after the clean_wait
+            # time, so this is the normal end of a cleaning, not an error
+            # --------------------------------------------------------------
+            log('Drive device ' + drive_device + ' (' + sg + ') still reports \'Cleaning action required\','
+                + ' \'clean_poll_timeout\' is 0 so it is only checked once', 30)
+            return 0
+        if monotonic() >= deadline:
+            log('The maximum \'clean_poll_timeout\' time of ' + str(clean_poll_timeout) + ' seconds has been reached,'
+                + ' drive device ' + drive_device + ' (' + sg + ') still reports \'Cleaning action required\'', 20)
+            return 1
+        log('Drive device ' + drive_device + ' (' + sg + ') still reports \'Cleaning action required\', checking again in '
+            + str(clean_poll_interval) + ' \'clean_poll_interval\' seconds', 20)
+        sleep(min(clean_poll_interval, max(deadline - monotonic(), 0)))
 
 def checkdrive():
     'Given a tape drive /dev/sg# node, check sg_logs output, call clean() if "Cleaning action required" messages exist.'
@@ -711,7 +910,7 @@ def checkdrive():
         log('WARN: ' + clean_action.group() + ' for drive device ' + drive_device + ' (' + sg + '):', 20)
         if auto_clean:
             log('INFO: Drive requires cleaning and the \'auto_clean\' variable is True, calling clean() function', 20)
-            clean(cln_tapes)
+            clean(cln_tapes, sg)
         else:
             log('WARN: Drive requires cleaning but the \'auto_clean\' variable is False, skipping cleaning', 20)
     else:
@@ -721,7 +920,7 @@ def checkdrive():
     # -----------------------------
     return 0
 
-def load(slt=None, drv_dev=None, drv_idx=None, vol=None, cln=False):
+def load(slt=None, drv_dev=None, drv_idx=None, vol=None, cln=False, sg=None):
     'Load a tape from a slot to a drive.'
     log('In function: load()', 50)
     if slt is None:
@@ -735,7 +934,6 @@ def load(slt=None, drv_dev=None, drv_idx=None, vol=None, cln=False):
     # Don't bother trying to load a tape into a drive that is full
     # ------------------------------------------------------------
     if loaded() != '0':
-        log('Exiting with return code 1', 30)
         return 1
     # Don't bother trying to load a tape from a slot that is empty
     # ------------------------------------------------------------
@@ -743,41 +941,53 @@ def load(slt=None, drv_dev=None, drv_idx=None, vol=None, cln=False):
         log('Slot ' + slt + ' is empty, exiting with return code 1', 20)
         return 1
     else:
-        cmd = mtx_bin + ' -f ' + chgr_device + ' load ' + slt + ' ' + drv_idx
+        cmd = mtx_prefix_lst + ['load', slt, drv_idx]
         log('Loading ' + ('cleaning tape' if cln else 'volume') \
             + (' (' + vol[0] + ')' if vol[0] != '' else '') + ' from slot ' + slt \
             + ' to drive device ' + drv_dev + ' (drive index: ' + drv_idx + ')', 20)
-        log('mtx command: ' + cmd, 30)
+        log('mtx command: ' + shlex.join(cmd), 30)
         result = get_shell_result(cmd)
         log_cmd_results(result)
+        clear_mtx_status()
         # Don't call chk_cmd_result() here,
         # we need to log something specific
         # ---------------------------------
         if result.returncode != 0:
-            log('ERROR calling: ' + cmd, 20)
+            log('ERROR calling: ' + shlex.join(cmd), 20)
             fail_txt = 'Failed to load drive device ' + drv_dev + ' (drive index: ' + drv_idx + ') ' \
                      + ('with volume (' + vol[0] + ') ' if vol[0] != '' else '') + 'from slot ' + slt
             log(fail_txt, 20)
             log('Err: ' + result.stderr, 20)
-            log('Exiting with return code ' + str(result.returncode), 30)
             # The SD will print this stdout after 'Result=' in the job log
             # ------------------------------------------------------------
             print(fail_txt + ' Err: ' + result.stderr)
-            sys.exit(result.returncode)
+            # A failed cleaning tape load happens inside of the unload()
+            # of a data tape, so it still has to end the script here.
+            # Otherwise, the script exits at the end with our return code.
+            # -------------------------------------------------------------
+            if cln:
+                log('Exiting with return code ' + str(result.returncode), 30)
+                sys.exit(result.returncode)
+            return result.returncode
         # If we are loading a cleaning tape, do the clean_wait
         # waiting here instead of the load_sleep time
         # ----------------------------------------------------
         if cln:
-            log('A cleaning tape was just loaded. Will wait (' + clean_wait + ') \'clean_wait\' seconds, then unload it', 20)
-            sleep(int(clean_wait))
-            log('Done waiting (' + clean_wait + ') \'clean_wait\' seconds', 30)
+            log('A cleaning tape was just loaded. Will wait (' + str(clean_wait) + ') \'clean_wait\' seconds, then unload it', 20)
+            sleep(clean_wait)
+            log('Done waiting (' + str(clean_wait) + ') \'clean_wait\' seconds', 30)
+            # Whatever wait_for_clean() finds, the cleaning
+            # tape must always be unloaded before we return
+            # ----------------------------------------------
+            if sg is not None and wait_for_clean(sg) != 0:
+                log('Unloading the cleaning tape anyway', 20)
             unload(slt, drv_dev, drv_idx, vol, cln=True)
         else:
             # Sleep load_sleep seconds after the drive signals it is ready
             # ------------------------------------------------------------
-            if int(load_sleep) != 0:
-                log('Sleeping for \'load_sleep\' time of ' + load_sleep + ' seconds to let the drive settle', 20)
-                sleep(int(load_sleep))
+            if load_sleep != 0:
+                log('Sleeping for \'load_sleep\' time of ' + str(load_sleep) + ' seconds to let the drive settle', 20)
+                sleep(load_sleep)
             # TODO: 20240510 - Why did I comment this? lol
             # elif chk_drive:
             #     log('The chk_drive variable is True, calling checkdrive() function', 20)
@@ -795,54 +1005,56 @@ def unload(slt=None, drv_dev=None, drv_idx=None, vol=None, cln=False):
         drv_idx = drive_index
     if vol is None:
         vol = volume
-    # Don't bother trying to unload an empty drive
-    # --------------------------------------------
+    # Don't bother trying to unload an empty drive. This also
+    # skips the checkdrive() sg node lookup (sysfs, or lsscsi
+    # if that fails) and sg_logs call below. We only check a
+    # drive for cleaning right after we have unloaded a tape.
+    # --------------------------------------------------------
     if loaded() == '0':
-        log('Exiting with return code 0', 30)
         return 0
     # Don't bother trying to unload a tape into a full slot
     # -----------------------------------------------------
     elif vol[1] != '':
         log('Slot ' + slt + ' is full with volume (' + vol[1] + ')', 20)
-        log('Exiting with return code 1', 30)
         return 1
     else:
         if offline:
             log('The \'offline\' variable is True. Sending drive device ' + drv_dev \
                 + ' offline command before unloading it', 30)
-            cmd = mt_bin + ' -f ' + drv_dev + ' offline'
-            log('mt command: ' + cmd, 30)
+            cmd = [mt_bin, '-f', drv_dev, 'offline']
+            log('mt command: ' + shlex.join(cmd), 30)
             result = get_shell_result(cmd)
             log_cmd_results(result)
             chk_cmd_result(result, cmd)
-            if int(offline_sleep) != 0:
-                log('Sleeping for \'offline_sleep\' time of ' + offline_sleep 
+            if offline_sleep != 0:
+                log('Sleeping for \'offline_sleep\' time of ' + str(offline_sleep)
                     + ' seconds to let the drive settle before unloading it', 20)
-                sleep(int(offline_sleep))
-        cmd = mtx_bin + ' -f ' + chgr_device + ' unload ' + slt + ' ' + drv_idx
+                sleep(offline_sleep)
+        cmd = mtx_prefix_lst + ['unload', slt, drv_idx]
+        # The drive is named the same way in each of the messages below
+        # -------------------------------------------------------------
+        drv_txt = 'drive device ' + drv_dev + ' (drive index: ' + drv_idx + ')'
         log('Unloading ' + ('cleaning tape' if cln else 'volume') \
-            + (' (' + vol[0] + ') ' if vol[0] != '' else '') + 'from drive device ' \
-            + drv_dev + ' (drive index: ' + drv_idx + ')' + ' to slot ' + slt, 20)
-        log('mtx command: ' + cmd, 30)
+            + (' (' + vol[0] + ') ' if vol[0] != '' else '') + 'from ' + drv_txt + ' to slot ' + slt, 20)
+        log('mtx command: ' + shlex.join(cmd), 30)
         result = get_shell_result(cmd)
         log_cmd_results(result)
+        clear_mtx_status()
         # Don't call chk_cmd_result() here,
         # we need to log something specific
         # ---------------------------------
         if result.returncode != 0:
-            log('ERROR calling: ' + cmd, 20)
-            fail_txt = 'Failed to unload drive device ' + drv_dev + ' (drive index: ' + drv_idx + ') ' \
+            log('ERROR calling: ' + shlex.join(cmd), 20)
+            fail_txt = 'Failed to unload ' + drv_txt + ' ' \
                      + ('with volume (' + vol[0] + ') ' if vol[0] != '' else '') + 'to slot ' + slt
             log(fail_txt, 20)
             log('Err: ' + result.stderr, 20)
-            log('Exiting with return code ' + str(result.returncode), 30)
             # The SD will print this stdout after 'Result=' in the Bacula job log
             # -------------------------------------------------------------------
             print(fail_txt + ' Err: ' + result.stderr)
         else:
             log('Successfully unloaded ' + ('cleaning tape' if cln else 'volume') \
-                + ' (' + (vol[0] + ') ' if vol[0] != '' else '') + 'from drive device ' \
-                + drv_dev + ' (drive index: ' + drv_idx + ') to slot ' + slt, 20)
+                + ' (' + (vol[0] + ') ' if vol[0] != '' else '') + 'from ' + drv_txt + ' to slot ' + slt, 20)
             # After successful unload, check to see if the tape drive should be cleaned.
             # We need to intercept the process here, before we exit from the unload,
             # otherwise the SD will move on and try to load the next tape.
@@ -854,18 +1066,16 @@ def unload(slt=None, drv_dev=None, drv_idx=None, vol=None, cln=False):
                 log('A cleaning tape (' + vol[0] + ') was just unloaded, skipping \'Cleaning action required\' checks', 20)
             elif chk_drive:
                 log('The chk_drive variable is True, calling checkdrive() function', 20)
-                if checkdrive() == 1:
-                    # I think there is nothing to do here. We could not get an sg
-                    # node, or there are no cleaning tapes in the library, so we
-                    # cannot run sg_logs but the drive has been successfully
-                    # unloaded, so we just need to log and exit cleanly here.
-                    # -----------------------------------------------------------
-                    log('Exiting unload() volume ' + ('(' + vol[0] + ')' if vol != '' else '') \
-                        + ' with return code ' + str(result.returncode), 30)
-                    return 0
+                # If checkdrive() returns 1, there is nothing to do here. We
+                # could not get an sg node, or there are no cleaning tapes in
+                # the library, so we cannot run sg_logs but the drive has been
+                # successfully unloaded, so we just need to log and exit
+                # cleanly below, the same as when checkdrive() returns 0.
+                # -------------------------------------------------------------
+                checkdrive()
             else:
-                log('The chk_drive variable is False, skipping \'Cleaning action required\' checks', 20)
-            log('Exiting unload() volume ' + ('(' + vol[0] + ') ' if vol != '' else '') \
+                log('The chk_drive variable is False, skipping \'Cleaning action required\' checks', 30)
+            log('Exiting unload() volume ' + ('(' + vol[0] + ') ' if vol[0] != '' else '') \
                 + 'with return code ' + str(result.returncode), 30)
     return result.returncode
 
@@ -875,37 +1085,39 @@ def transfer():
     # 'drive_device' position on the command line
     # --------------------------------------------
     log('In function: transfer()', 50)
-    cmd = mtx_bin + ' -f ' + chgr_device + ' transfer ' + slot + ' ' + drive_device
-    log('Transferring volume ' + ('(' + volume[0] + ') ' if volume[0] != '' else '(EMPTY) ') + 'from slot '
-        + slot + ' to slot ' + drive_device + (' containing volume (' + volume[1] + ')' if volume[1] != '' else '' ), 20)
+    # Check this first, so nothing else is
+    # built for a transfer we will not try
+    # ------------------------------------
     if volume[0] == '' or volume[1] != '':
        fail_txt = 'The source slot is empty, or the destination slot is full, will not even attempt the transfer'
-       log(fail_txt, 20)
-       log('Exiting with return code 1', 30)
+       log(fail_txt + ' from slot ' + slot + ' to slot ' + drive_device, 20)
        print('Err: ' + fail_txt)
-       sys.exit(1)
+       return 1
     else:
-       log('mtx command: ' + cmd, 30)
+       # The volume and slots are described the same way in each
+       # of the messages below, so only build that text once
+       # --------------------------------------------------------
+       xfer_txt = 'volume (' + volume[0] + ') from slot ' + slot + ' to slot ' + drive_device
+       log('Transferring ' + xfer_txt, 20)
+       cmd = mtx_prefix_lst + ['transfer', slot, drive_device]
+       log('mtx command: ' + shlex.join(cmd), 30)
        result = get_shell_result(cmd)
        log_cmd_results(result)
+       clear_mtx_status()
        # Don't call chk_cmd_result() here,
        # we need to log something specific
        # ---------------------------------
        if result.returncode != 0:
-           log('ERROR calling: ' + cmd, 20)
-           fail_txt = 'Failed to transfer volume ' + ('(' + volume[0] + ') ' if volume[0] != '' else '(EMPTY) ') + 'from slot ' \
-                    + slot + ' to slot ' + drive_device + (' containing volume (' + volume[1] + ')' if volume[1] != '' else '' )
+           log('ERROR calling: ' + shlex.join(cmd), 20)
+           fail_txt = 'Failed to transfer ' + xfer_txt
            log(fail_txt, 20)
            log('Err: ' + result.stderr, 20)
-           log('Exiting with return code ' + str(result.returncode), 30)
            # The SD will print this stdout after 'Result=' in the job log
            # ------------------------------------------------------------
            print(fail_txt + ' Err: ' + result.stderr)
            return result.returncode
        else:
-           log('Successfully transferred volume ' + ('(' + volume[0] + ') ' if volume[0] != '' else '(EMPTY) ') \
-               + 'from slot ' + slot + ' to slot ' + drive_device, 20)
-           log('Exiting with return code ' + str(result.returncode), 30)
+           log('Successfully transferred ' + xfer_txt, 20)
            return 0
 
 # ================
@@ -924,21 +1136,16 @@ if not os.path.exists(config_file) or not os.access(config_file, os.R_OK):
     usage()
 else:
     try:
-        config = ConfigParser(inline_comment_prefixes=('# ', ';'), interpolation=BasicInterpolation())
-        config.read(config_file)
         # Create 'config_dict' dictionary from config file
         # ------------------------------------------------
-        config_dict = dict(config.items(config_section))
+        config_dict = read_config(config_file, config_section)
     except Exception as err:
         print('  - An exception has occurred while reading configuration file: ' + str(err))
         print(print_opt_errors('section'))
         sys.exit(1)
 
-# For each key in the config_dict dictionary, make its key name
-# into a global variable and assign it the key's dictionary value.
-# https://www.pythonforbeginners.com/basics/convert-string-to-variable-name-in-python
-# -----------------------------------------------------------------------------------
-myvars = vars()
+# Convert the config_dict values that are not strings
+# ---------------------------------------------------
 for k, v in config_dict.items():
     if k in cfg_file_true_false_lst:
         # Convert all the True/False strings to booleans on the fly
@@ -948,15 +1155,32 @@ for k, v in config_dict.items():
         # the boolean True or False, else print an
         # error, the instructions, and exit.
         # ----------------------------------------
-        if v.lower() == 'true':
+        v = v.lower()
+        if v == 'true':
             config_dict[k] = True
-        elif v.lower() == 'false':
+        elif v == 'false':
             config_dict[k] = False
-        else:
+    elif k in cfg_file_int_lst:
+        # Convert the numeric strings to integers. Anything
+        # else is left as a string and reported below.
+        # -------------------------------------------------
+        try:
+            config_dict[k] = int(v)
+        except ValueError:
+            pass
+    elif k in cfg_file_float_lst:
+        try:
+            config_dict[k] = float(v)
+        except ValueError:
             pass
-    # Set the global variable
-    # -----------------------
-    myvars[k] = config_dict[k]
+
+# For each key in the config_dict dictionary, make its key name
+# into a global variable and assign it the key's dictionary value.
+# This is done with one update() of the module's globals so that
+# they are all set at once, before any function looks them up.
+# https://www.pythonforbeginners.com/basics/convert-string-to-variable-name-in-python
+# -----------------------------------------------------------------------------------
+vars().update(config_dict)
 
 # Assign variables from args set
 # ------------------------------
@@ -974,15 +1198,39 @@ jobid = args['--jobid']
 # of the jobname passed to us by the SD?
 # --------------------------------------
 if args['--jobname'] is not None and strip_jobname:
-    jobname = re.sub(r'(^.*)\.\d{4}\-\d{2}-\d{2}_.*', '\\1', args['--jobname'])
+    jobname = jobname_re.sub('\\1', args['--jobname'])
 else:
     jobname = args['--jobname']
 
-# Check the boolean variables
-# ---------------------------
-for var in cfg_file_true_false_lst:
-    if config_dict[var] not in (True, False):
-        print(print_opt_errors('truefalse', tfk=var, tfv=str(config_dict[var])))
+# Build the log line prefix now that we have the jobid and jobname
+# ----------------------------------------------------------------
+log_prefix = (chgr_name + ' ' if len(chgr_name) != 0 else '') \
+             + ('JobId: ' + jobid + ' ' if jobid not in ('', '0', 'None') else '') \
+             + ('Job: ' + jobname + ' ' if jobname not in ('', 'None', '*System*') else (jobname + ' ' if jobname != 'None' else ''))
+
+# Check the boolean and numeric variables in the order
+# they are in the config file, so the first bad one
+# is always the one reported
+# ----------------------------------------------------
+for var, val in config_dict.items():
+    if var in cfg_file_true_false_lst and val not in (True, False):
+        print(print_opt_errors('truefalse', tfk=var, tfv=str(val)))
+        usage()
+    elif var in cfg_file_int_lst and not isinstance(val, int):
+        print(print_opt_errors('int', tfk=var, tfv=str(val)))
+        usage()
+    elif var in cfg_file_float_lst and not (isinstance(val, float) and math.isfinite(val)):
+        print(print_opt_errors('float', tfk=var, tfv=str(val)))
+        usage()
+    # The poll intervals are passed to sleep(), which raises a ValueError
+    # for a negative value, after a tape has already been moved. An
+    # interval of 0 would start mt or sg_logs back to back, so reject both.
+    # ---------------------------------------------------------------------
+    elif var in ('clean_poll_interval', 'load_poll_interval') and val <= 0:
+        print(print_opt_errors('positive', tfk=var, tfv=str(val)))
+        usage()
+    elif var == 'clean_poll_timeout' and val < 0:
+        print(print_opt_errors('notnegative', tfk=var, tfv=str(val)))
         usage()
 
 # If debug_level is at a minimum
@@ -999,6 +1247,9 @@ log('Drive Device: ' + drive_device, 10, hdr=True)
 log('Command: ' + mtx_cmd, 10, hdr=True)
 log('Drive Index: ' + drive_index, 10, hdr=True)
 log('Slot: ' + slot, 10, hdr=True)
+log('Load Poll Interval: ' + str(load_poll_interval) + ' seconds', 10, hdr=True)
+log('Cleaning Poll Interval: ' + str(clean_poll_interval) + ' seconds', 10, hdr=True)
+log('Cleaning Poll Timeout: ' + str(clean_poll_timeout) + ' seconds', 10, hdr=True)
 
 # Log all configuration file
 # variables and their values?
@@ -1014,52 +1265,62 @@ log('-'*22, 10, hdr=True)
 # --------------------------------------------
 uname = get_uname()
 
-# Check that the binaries exist and that they are executable.
-# NOTE: A small chicken and egg issue exists here because we call
-# uname above but we have not verified the binary exists and is
-# executable by us (ie: bacula user). We can't check the binaries
-# first because we filter out testing binaries based on some
-# platform-specific binaries that don't exist on other platforms
-# using the 'uname' variable assigned by the get_uname()
-# function. Should be safe, as all systems have uname in the
-# $PATH.
+# Check that the binaries exist and that they are executable. We
+# filter out testing binaries based on some platform-specific
+# binaries that don't exist on other platforms using the 'uname'
+# variable assigned by the get_uname() function above.
 # ---------------------------------------------------------------
 chk_bins()
 
-# Check the OS to assign the 'ready' variable
-# to know when a drive is loaded and ready.
-# -------------------------------------------
-ready = get_ready_str()
+# Every mtx command line starts with the same binary and changer
+# device, so build that part once. Each caller adds its operation.
+# ----------------------------------------------------------------
+mtx_prefix_lst = [mtx_bin, '-f', chgr_device]
 
-# Get a list of all volumes in all slots
-# This will be used throughout the script
-# ---------------------------------------
-all_slots = listall()
+# The library's status is needed by every command, so start the
+# 'mtx status' command now and let it run while get_ready_str()
+# calls 'mt' for a load. If an inventory is needed, it must be done
+# first, so in that case both of them are called below instead.
+# -----------------------------------------------------------------
+if not inventory:
+    start_mtx_status()
+
+# Check the OS to assign the 'ready' variable to know
+# when a drive is loaded and ready. Only wait_for_drive()
+# uses it, and only the load command calls that function.
+# -------------------------------------------------------
+if mtx_cmd == 'load':
+    ready = get_ready_str()
+
+# Get the parsed elements of all slots and drives from
+# one 'mtx status'. list, listall, loaded, and slots are
+# built from them, and getvolname() and chk_for_cln_tapes()
+# use them even after a tape has been moved.
+# ---------------------------------------------------------
+if inventory:
+    call_inventory()
+all_elements = mtx_elements()
 
 # Check to see if the operation can/should log volume
-# names. If yes, call the getvolname() function
+# names. If yes, call the getvolname() function. The
+# loaded command only needs the drive's element.
 # ---------------------------------------------------
-if mtx_cmd in ('load', 'loaded', 'unload', 'transfer'):
+if mtx_cmd in vol_mtx_cmd_set:
     volume = getvolname()
 
-# Call the appropriate function based on the mtx_cmd
-# --------------------------------------------------
-if mtx_cmd == 'list':
-    print(list())
-elif mtx_cmd == 'listall':
-   print(all_slots)
-elif mtx_cmd == 'slots':
-    print(slots())
-elif mtx_cmd == 'loaded':
-    print(loaded())
-elif mtx_cmd == 'load':
-    result = load()
-    sys.exit(result)
-elif mtx_cmd == 'unload':
-    result = unload()
-    sys.exit(result)
-elif mtx_cmd == 'transfer':
-   transfer()
-else:
-    print(print_opt_errors('command'))
-    usage()
+# Call the appropriate function based on the mtx_cmd. The
+# mtx_cmd was checked against valid_mtx_cmd_lst above, so
+# it is always one of this dictionary's keys.
+# --------------------------------------------------------
+mtx_cmd_dict = {'list': list, 'listall': listall, 'slots': slots, 'loaded': loaded,
+                'load': load, 'unload': unload, 'transfer': transfer}
+result = mtx_cmd_dict[mtx_cmd]()
+
+# The commands which move a tape return their return code. The
+# others return the text the SD reads from our stdout, and exit 0
+# ---------------------------------------------------------------
+if mtx_cmd not in vol_mtx_cmd_set:
+    print(result)
+    result = 0
+log('Exiting with return code ' + str(result), 30)
+sys.exit(result)